@@ -1,12 +1,16 @@
 import os
-import requests
+import asyncio
+import aiohttp
 from urllib.parse import urlparse
-from azure.storage.blob import BlobClient
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.storage.blob.aio import BlobClient, BlobServiceClient
 
 CONN_STR = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
 ACCOUNT_NAME = "saokqualiteeaufr"
 CONTAINER = "raw"
+BLOCK_SIZE = 8 * 1024 * 1024   # taille des blocs stagés dans Azure
+STAGE_CONCURRENCY = 8          # blocs uploadés en parallèle par fichier (RAM ≈ STAGE_CONCURRENCY × BLOCK_SIZE)
+HTTP_POOL_MAXSIZE = 16         # connexions max dans le pool HTTP (toutes sur static.data.gouv.fr)
 
 URLS = [
     "https://static.data.gouv.fr/resources/resultats-du-controle-sanitaire-de-leau-distribuee-commune-par-commune/20251001-103424/dis-2025-dept.zip",
@@ -16,27 +20,94 @@ URLS = [
     "https://static.data.gouv.fr/resources/resultats-du-controle-sanitaire-de-leau-distribuee-commune-par-commune/20250329-074506/dis-2024-dept.zip"
 ]
 
-for url in URLS:
-    filename = os.path.basename(urlparse(url).path)  # ex: dis-2025-dept.zip
+def _block_id(index: int) -> str:
+    # ids de même longueur pour un blob donné ; le SDK les encode lui-même en base64
+    return f"{index:08d}"
+
+async def _stage_block(blob: BlobClient, block_id: str, data: bytes, sem: asyncio.Semaphore):
+    try:
+        await blob.stage_block(block_id, data)
+    finally:
+        sem.release()
 
+def _blob_path(url: str) -> str:
+    filename = os.path.basename(urlparse(url).path)  # ex: dis-2025-dept.zip
     # destination logique dans raw
-    blob_path = f"zip/{filename}"
+    return f"zip/{filename}"
 
-    blob = BlobClient.from_connection_string(CONN_STR, container_name=CONTAINER, blob_name=blob_path)
+async def _blob_exists(svc: BlobServiceClient, url: str) -> bool:
+    return await svc.get_blob_client(CONTAINER, _blob_path(url)).exists()
 
-    # ✅ Vérifier si le blob existe déjà
-    try:
-        blob.get_blob_properties()
-        print(f"⏩ SKIP : {filename} déjà présent dans Azure → {blob_path}")
-        continue     # on passe au fichier suivant
-    except ResourceNotFoundError:
-        pass  # il n'existe pas → on télécharge
+async def ingest_url(session: aiohttp.ClientSession, svc: BlobServiceClient, url: str):
+    blob_path = _blob_path(url)
+    blob = svc.get_blob_client(CONTAINER, blob_path)
 
     print(f"⬇️ Téléchargement : {url}")
-    with requests.get(url, stream=True, timeout=120) as r:
-        r.raise_for_status()
-        blob.upload_blob(r.raw, overwrite=False)
+    block_ids = []
+    uploads = []
+    # borne le nombre de blocs en vol : le téléchargement attend si Azure est plus lent
+    sem = asyncio.Semaphore(STAGE_CONCURRENCY)
+
+    async def flush(data: bytes):
+        await sem.acquire()
+        block_id = _block_id(len(block_ids))
+        block_ids.append(block_id)
+        uploads.append(asyncio.create_task(_stage_block(blob, block_id, data, sem)))
+
+    buf = bytearray()
+    try:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(BLOCK_SIZE):
+                # iter_chunked peut rendre des morceaux plus petits : on regroupe jusqu'à BLOCK_SIZE
+                buf.extend(chunk)
+                if len(buf) >= BLOCK_SIZE:
+                    await flush(bytes(buf))
+                    buf.clear()
+        if buf:
+            await flush(bytes(buf))
+    finally:
+        # attend tous les blocs, même si l'un échoue (ou si le téléchargement a échoué)
+        staged = await asyncio.gather(*uploads, return_exceptions=True)
+    errors = [r for r in staged if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+
+    # IfMissing : équivalent de overwrite=False
+    await blob.commit_block_list(block_ids, match_condition=MatchConditions.IfMissing)
 
     print(f"✅ Upload OK -> abfss://{CONTAINER}@{ACCOUNT_NAME}.dfs.core.windows.net/{blob_path}\n")
 
-print("🎉 Ingestion terminée (les fichiers existants n'ont pas été re-téléchargés).")
+async def main():
+    # un seul client Azure pour tout le script : credentials parsés une fois, pipeline et
+    # connexions HTTP partagés par tous les blob clients qui en dérivent
+    async with BlobServiceClient.from_connection_string(CONN_STR) as svc:
+        # ✅ Vérifier en parallèle quels blobs existent déjà (1 HEAD par URL, tous en même temps)
+        existence = dict(zip(URLS, await asyncio.gather(*(_blob_exists(svc, url) for url in URLS))))
+        for url in URLS:
+            if existence[url]:
+                print(f"⏩ SKIP : {os.path.basename(_blob_path(url))} déjà présent dans Azure → {_blob_path(url)}")
+        todo = [url for url in URLS if not existence[url]]
+
+        if todo:
+            # une seule session HTTP partagée (keep-alive) pour toutes les URLs :
+            # même hôte → les connexions TCP/TLS du pool sont réutilisées
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=120, sock_read=120)
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_MAXSIZE, limit_per_host=HTTP_POOL_MAXSIZE)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                # return_exceptions : un échec ne ferme pas la session / le client Azure sous les
+                # pieds des autres uploads, chacun va au bout avant qu'on remonte les erreurs
+                results = await asyncio.gather(
+                    *(ingest_url(session, svc, url) for url in todo), return_exceptions=True
+                )
+
+            failures = [(url, r) for url, r in zip(todo, results) if isinstance(r, BaseException)]
+            for url, err in failures:
+                print(f"❌ Échec : {url} → {err!r}")
+            if failures:
+                raise RuntimeError(f"{len(failures)}/{len(todo)} ZIP(s) en échec, relancer le script pour les reprendre")
+
+    print("🎉 Ingestion terminée (les fichiers existants n'ont pas été re-téléchargés).")
+
+if __name__ == "__main__":
+    asyncio.run(main())
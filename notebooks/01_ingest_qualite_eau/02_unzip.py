@@ -3,35 +3,156 @@ import os
 import io
 import mimetypes
 import posixpath
-import tempfile
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 from azure.storage.blob import BlobServiceClient, BlobClient, ContentSettings
-from azure.core.exceptions import ResourceNotFoundError
 
 CONN_STR   = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
 CONTAINER  = "raw"
 ZIP_PREFIX = "zip/"     # où 01_ingest_data.py a déposé les .zip
 OUT_PREFIX = "unzip/"   # où on écrit les fichiers extraits
+RANGE_READ_SIZE = 4 * 1024 * 1024   # taille max. d'une lecture Range sur le zip (bornée à l'entrée lue)
+EXTRACT_WORKERS = 8                 # entrées du zip extraites/uploadées en parallèle
+
+# client créé une seule fois au niveau module : credentials parsés une fois, pipeline HTTP et
+# pool de connexions partagés par tous les blob clients (thread-safe, réutilisé par les workers)
+_SVC       = BlobServiceClient.from_connection_string(CONN_STR)
+_CONTAINER = _SVC.get_container_client(CONTAINER)
 
 # crée un marker après succès pour éviter de retraiter le même zip
 def _marker_path(zip_basename: str) -> str:
     return f"{OUT_PREFIX}{zip_basename}/_SUCCESS"
 
-def _blob_exists(container_client, blob_path: str) -> bool:
-    try:
-        container_client.get_blob_client(blob_path).get_blob_properties()
-        return True
-    except ResourceNotFoundError:
-        return False
-
 def _guess_content_type(name: str) -> str:
     return mimetypes.guess_type(name)[0] or "application/octet-stream"
 
+class BlobRangeReader(io.RawIOBase):
+    """Fichier en lecture seule (seek + read) adossé à un blob via des requêtes Range.
+
+    zipfile n'a besoin que de seek/read : on lit l'archive directement dans Azure
+    sans la télécharger entièrement sur disque.
+    """
+
+    def __init__(self, blob_client: BlobClient, size: int):
+        self._blob = blob_client
+        self._size = size
+        self._end = size   # borne haute des lectures, cf. limit_to
+        self._pos = 0
+
+    def limit_to(self, end: int) -> None:
+        """Borne les lectures suivantes à `end` (fin de l'entrée du zip en cours de lecture)."""
+        self._end = min(end, self._size)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"whence invalide : {whence}")
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, b) -> int:
+        if self._pos >= self._end:
+            return 0
+        length = min(len(b), self._end - self._pos)
+        data = self._blob.download_blob(offset=self._pos, length=length).readall()
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+def _open_remote_zip(raw: BlobRangeReader) -> zipfile.ZipFile:
+    # BufferedReader regroupe les petites lectures de zipfile (en-têtes) en requêtes de RANGE_READ_SIZE
+    return zipfile.ZipFile(io.BufferedReader(raw, buffer_size=RANGE_READ_SIZE), "r")
+
+def _member_ends(infos, size: int) -> dict:
+    """Fin de chaque entrée dans l'archive : début de l'entrée suivante (ou fin du blob).
+
+    L'extent [header_offset, fin) couvre en-tête local, données compressées et data descriptor.
+    """
+    offsets = sorted(info.header_offset for info in infos)
+    return dict(zip(offsets, offsets[1:] + [size]))
+
+class _ZipExtractor:
+    """Extraction des entrées d'un zip distant vers target_root, appelable depuis plusieurs threads.
+
+    ZipFile n'est pas thread-safe : chaque thread ouvre le sien (fermés par close()).
+    """
+
+    def __init__(self, container, blob_client: BlobClient, size: int, target_root: str, existing: set):
+        self._container = container
+        self._blob = blob_client
+        self._size = size
+        self._target_root = target_root
+        self._existing = existing   # fichiers déjà extraits (run précédent interrompu)
+        self._local = threading.local()
+        self._opened = []
+        self._opened_lock = threading.Lock()
+        with _open_remote_zip(BlobRangeReader(blob_client, size)) as zf:
+            self._ends = _member_ends(zf.infolist(), size)
+            self.infos = [info for info in zf.infolist() if not info.is_dir()]
+
+    def _thread_zip(self) -> zipfile.ZipFile:
+        local = self._local
+        if getattr(local, "zf", None) is None:
+            local.raw = BlobRangeReader(self._blob, self._size)
+            local.zf = _open_remote_zip(local.raw)
+            with self._opened_lock:
+                self._opened.append(local.zf)
+        return local.zf
+
+    def extract(self, info: zipfile.ZipInfo) -> bool:
+        # chemin interne normalisé (POSIX)
+        internal = info.filename.lstrip("./\\").replace("\\", "/")
+        dest_path = f"{self._target_root}{internal}"
+
+        # Idempotence : si le fichier existe déjà, passer
+        if dest_path in self._existing:
+            print(f"   • existe déjà, on saute : {dest_path}")
+            return False
+
+        # Ouvrir l'entrée du zip en stream et uploader
+        zf = self._thread_zip()
+        # lectures Range limitées à l'extent de l'entrée : le buffer ne déborde pas sur la suivante
+        self._local.raw.limit_to(self._ends[info.header_offset])
+        with zf.open(info, "r") as member_stream:
+            content_type = _guess_content_type(internal)
+            dest_client = self._container.get_blob_client(dest_path)
+            # length fourni : sinon le SDK fait seek(0, END) sur le flux pour mesurer sa taille,
+            # ce qui décompresse (et relit dans Azure) l'entrée une 2e fois.
+            # max_concurrency=1 : un seek arrière sur un ZipExtFile repart du début de l'entrée
+            dest_client.upload_blob(
+                member_stream,
+                length=info.file_size,
+                overwrite=False,
+                max_concurrency=1,
+                content_settings=ContentSettings(content_type=content_type),
+            )
+        print(f"   ✅ upload : {dest_path}")
+        return True
+
+    def close(self) -> None:
+        for zf in self._opened:
+            zf.close()
+
 def main():
-    svc = BlobServiceClient.from_connection_string(CONN_STR)
-    container = svc.get_container_client(CONTAINER)
+    container = _CONTAINER
 
     # 1) Lister tous les .zip sous raw/zip/
     zip_blobs = list(container.list_blobs(name_starts_with=ZIP_PREFIX))
@@ -51,45 +172,25 @@ def main():
 
         # 2) Skip si déjà traité (présence du marker)
         marker = _marker_path(zip_base)
-        if _blob_exists(container, marker):
+        if container.get_blob_client(marker).exists():
             print(f"⏩ SKIP {zip_filename} : déjà décompressé (marker présent).")
             skipped += 1
             continue
 
-        print(f"⬇️ Téléchargement de {zip_blob_path} …")
-        # 3) Télécharger le zip en fichier temporaire (plus robuste que tout en mémoire)
+        print(f"⬇️ Lecture de {zip_blob_path} …")
+        # 3) Lire le zip directement dans Azure (requêtes Range), sans fichier temporaire
         blob_client: BlobClient = container.get_blob_client(zip_blob_path)
-        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
-            downloader = blob_client.download_blob(max_concurrency=4)
-            downloader.readinto(tmp)  # stream -> file
-            tmp_path = tmp.name
-
-        extracted_count = 0
-        # 4) Extraire et uploader chaque entrée
-        with zipfile.ZipFile(tmp_path, "r") as zf:
-            for info in zf.infolist():
-                if info.is_dir():
-                    continue
-                # chemin interne normalisé (POSIX)
-                internal = info.filename.lstrip("./\\").replace("\\", "/")
-                dest_path = f"{target_root}{internal}"
-
-                # Idempotence : si le fichier existe déjà, passer
-                if _blob_exists(container, dest_path):
-                    print(f"   • existe déjà, on saute : {dest_path}")
-                    continue
-
-                # Ouvrir l'entrée du zip en stream et uploader
-                with zf.open(info, "r") as member_stream:
-                    content_type = _guess_content_type(internal)
-                    dest_client = container.get_blob_client(dest_path)
-                    dest_client.upload_blob(
-                        member_stream,
-                        overwrite=False,
-                        content_settings=ContentSettings(content_type=content_type),
-                    )
-                print(f"   ✅ upload : {dest_path}")
-                extracted_count += 1
+
+        # fichiers déjà extraits (run précédent interrompu) : 1 LIST au lieu d'un HEAD par entrée
+        existing = {e.name for e in container.list_blobs(name_starts_with=target_root)}
+
+        # 4) Extraire et uploader chaque entrée, en parallèle
+        extractor = _ZipExtractor(container, blob_client, b.size, target_root, existing)
+        try:
+            with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as ex:
+                extracted_count = sum(ex.map(extractor.extract, extractor.infos))
+        finally:
+            extractor.close()
 
         # 5) Créer un marker _SUCCESS avec quelques métadonnées (json/texte)
         ts = datetime.now(timezone.utc).isoformat()
@@ -104,12 +205,6 @@ def main():
         print(f"🏁 FIN {zip_filename} → {extracted_count} fichier(s) extraits. Marker : {marker}")
         processed += 1
 
-        # Nettoyage du fichier temporaire
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-
     print(f"\nRésumé : {processed} zip(s) traités, {skipped} zip(s) ignorés (déjà décompressés).")
 
 if __name__ == "__main__":
@@ -1,12 +1,10 @@
-# pip install azure-storage-blob pandas pyarrow
+# pip install azure-storage-blob pyarrow numpy
 import os
-import io
 import re
-import tempfile
-import pandas as pd
-from typing import List, Optional
-from azure.storage.blob import BlobServiceClient, ContentSettings
-from azure.core.exceptions import ResourceNotFoundError
+from concurrent.futures import ProcessPoolExecutor
+from azure.storage.blob import ContentSettings
+
+from txt_parquet import blob_exists, build_year_parquet, get_container_client, list_year_dirs
 
 # ==== Config ====
 CONN_STR        = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
@@ -16,59 +14,21 @@ OUT_ROOT        = "parquet_result"   # sortie:   parquet_result/dis_result_YYYY.
 SKIP_IF_EXISTS  = True               # saute l'année si le .parquet existe déjà
 FORCE_SEP       = None               # ex ";" si tu connais le séparateur ; sinon auto
 FORCE_ENCODING  = None               # ex "utf-8" ou "latin-1" ; sinon auto
+DOWNLOAD_WORKERS = 8                 # nb de .txt téléchargés en parallèle par année
+YEAR_WORKERS    = min(5, os.cpu_count() or 1)   # années traitées en parallèle (1 process par année)
+ROW_GROUP_ROWS  = 1_000_000          # lignes par row group parquet
+UPLOAD_CONCURRENCY = 4               # blocs uploadés en parallèle pour le .parquet
+# RAM en vol ≈ YEAR_WORKERS × (DOWNLOAD_WORKERS × (table Arrow d'un .txt + MAX_SINGLE_GET_SIZE)
+#              + ROW_GROUP_ROWS lignes en attente) : fenêtre glissante de DOWNLOAD_WORKERS fichiers
+#              lus d'avance par année, réduire si besoin (lecture / assemblage : cf. txt_parquet.py)
 # ===============
 
 YEAR_DIR_RE     = re.compile(r"^unzip/dis-(\d{4})-dept/?$")
-RESULT_FILE_RE  = re.compile(r".*/DIS_RESULT.*\.txt$", re.IGNORECASE)
-
-def blob_exists(container_client, path: str) -> bool:
-    try:
-        container_client.get_blob_client(path).get_blob_properties()
-        return True
-    except ResourceNotFoundError:
-        return False
-
-def list_year_dirs(container_client) -> List[str]:
-    """Retourne les prefixes 'unzip/dis-YYYY-dept/' existants."""
-    prefixes = set()
-    for b in container_client.list_blobs(name_starts_with=f"{UNZIP_ROOT}/"):
-        parts = b.name.split("/")
-        if len(parts) >= 2 and parts[0] == UNZIP_ROOT and parts[1].startswith("dis-") and parts[1].endswith("-dept"):
-            prefixes.add("/".join(parts[:2]) + "/")
-    return sorted(prefixes)
-
-def detect_sep(sample: str) -> str:
-    if FORCE_SEP:
-        return FORCE_SEP
-    candidates = [";", ",", "\t", "|"]
-    counts = {c: sample.count(c) for c in candidates}
-    best = max(counts, key=counts.get)
-    return best if counts[best] > 0 else ";"
-
-def decode_bytes(raw: bytes) -> str:
-    if FORCE_ENCODING:
-        return raw.decode(FORCE_ENCODING)
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
-        try:
-            return raw.decode(enc)
-        except UnicodeDecodeError:
-            continue
-    # dernier recours : ne pas échouer
-    return raw.decode("latin-1", errors="replace")
-
-def read_txt_to_df(container_client, blob_path: str) -> Optional[pd.DataFrame]:
-    downloader = container_client.get_blob_client(blob_path).download_blob(max_concurrency=4)
-    raw = downloader.readall()
-    text = decode_bytes(raw)
-    head = "\n".join(text.splitlines()[:5])
-    sep = detect_sep(head)
-    try:
-        df = pd.read_csv(io.StringIO(text), sep=sep, dtype=str)
-        df.columns = [c.strip() for c in df.columns]
-        return df
-    except Exception as e:
-        print(f"   ❌ lecture KO {blob_path}: {e}")
-        return None
+
+def is_result_file(blob_name: str) -> bool:
+    # test préfixe/suffixe sur le nom de fichier : moins coûteux qu'une regex sur chaque blob listé
+    base = blob_name.rsplit("/", 1)[-1].upper()
+    return base.startswith("DIS_RESULT") and base.endswith(".TXT")
 
 def process_year(container_client, year_dir: str):
     m = YEAR_DIR_RE.match(year_dir.rstrip("/"))
@@ -85,8 +45,13 @@ def process_year(container_client, year_dir: str):
     # collecter les fichiers DIS_RESULT*.txt
     txt_paths = []
     for b in container_client.list_blobs(name_starts_with=year_dir):
-        if RESULT_FILE_RE.match(b.name):
-            txt_paths.append(b.name)
+        if not is_result_file(b.name):
+            continue
+        if not b.size:
+            # .txt vide : rien à lire (et une lecture Range sur un blob vide échoue en 416)
+            print(f"   ⚠️ fichier vide ignoré : {b.name}")
+            continue
+        txt_paths.append(b.name)
     txt_paths.sort()
 
     if not txt_paths:
@@ -95,46 +60,33 @@ def process_year(container_client, year_dir: str):
 
     print(f"➡️  Année {year}: {len(txt_paths)} fichier(s) à assembler → {out_blob}")
 
-    dfs = []
-    for p in txt_paths:
-        print(f"   • {p}")
-        df = read_txt_to_df(container_client, p)
-        if df is not None and len(df) > 0:
-            df["_source_blob"] = p
-            df["_year"] = year
-            dfs.append(df)
+    buf, rows = build_year_parquet(
+        container_client, txt_paths, year, DOWNLOAD_WORKERS, row_group_rows=ROW_GROUP_ROWS,
+        force_sep=FORCE_SEP, force_encoding=FORCE_ENCODING,
+    )
 
-    if not dfs:
+    if rows == 0:
         print(f"   ⚠️ aucune donnée lisible pour {year}")
         return
 
-    full = pd.concat(dfs, ignore_index=True)
-
-    # écrire un UNIQUE fichier parquet temporaire puis uploader vers Azure
-    import pyarrow as pa, pyarrow.parquet as pq
-    with tempfile.NamedTemporaryFile(suffix=".parquet", delete=False) as tmp:
-        table = pa.Table.from_pandas(full, preserve_index=False)
-        pq.write_table(table, tmp.name)
-        tmp_path = tmp.name
-
-    print(f"   ⬆️ upload vers: {out_blob} (rows={len(full)})")
-    with open(tmp_path, "rb") as f:
-        container_client.get_blob_client(out_blob).upload_blob(
-            f, overwrite=True,
-            content_settings=ContentSettings(content_type="application/octet-stream")
-        )
-    try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
+    # uploader le parquet (écrit en mémoire) vers Azure
+    print(f"   ⬆️ upload vers: {out_blob} (rows={rows})")
+    container_client.get_blob_client(out_blob).upload_blob(
+        buf, overwrite=True, max_concurrency=UPLOAD_CONCURRENCY,
+        content_settings=ContentSettings(content_type="application/octet-stream")
+    )
 
     print(f"✅ Année {year} → {out_blob}")
 
+def _process_year_entry(year_dir: str):
+    # exécuté dans un process fils : les clients Azure ne sont pas picklables, on les
+    # (re)crée ici, une seule fois par process
+    process_year(get_container_client(CONN_STR, CONTAINER), year_dir)
+
 def main():
-    svc = BlobServiceClient.from_connection_string(CONN_STR)
-    container = svc.get_container_client(CONTAINER)
+    container = get_container_client(CONN_STR, CONTAINER)
 
-    year_dirs = list_year_dirs(container)
+    year_dirs = list_year_dirs(container, UNZIP_ROOT)
     # Garde uniquement les années attendues (facultatif)
     year_dirs = [d for d in year_dirs if re.search(r"dis-(2021|2022|2023|2024|2025)-dept/?$", d)]
 
@@ -143,8 +95,9 @@ def main():
         return
 
     print(f"{len(year_dirs)} dossier(s) trouvés : {year_dirs}")
-    for yd in year_dirs:
-        process_year(container, yd)
+    # années indépendantes : process séparés pour paralléliser aussi le parsing CSV
+    with ProcessPoolExecutor(max_workers=YEAR_WORKERS) as ex:
+        list(ex.map(_process_year_entry, year_dirs))
 
     print("🎉 Assemblage Parquet DIS_RESULT terminé.")
 
@@ -0,0 +1,279 @@
+# Helpers communs à 03_build_parquet_plv.py et 04_build_parquet_result.py :
+# lecture des .txt DIS_* depuis Azure (pyarrow.csv en stream) et assemblage d'un parquet par année.
+import os
+import io
+import csv
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import csv as pacsv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Optional, Tuple
+from azure.storage.blob import BlobPrefix, BlobServiceClient
+
+SNIFF_LINES = 5                  # lignes lues pour détecter le séparateur
+HEADER_PROBE_BYTES = 64 * 1024   # lecture Range pour connaître les colonnes d'un fichier
+MAX_SINGLE_GET_SIZE = 32 * 1024 * 1024   # 1er GET d'un blob (les petits .txt tiennent en une requête)
+MAX_CHUNK_GET_SIZE  = 16 * 1024 * 1024   # GETs suivants (défaut SDK : 4 Mo)
+
+# _source_blob / _year : constantes par fichier → dictionary (lues comme string côté Spark)
+TRACE_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+def blob_exists(container_client, path: str) -> bool:
+    # exists() renvoie un booléen (HEAD) sans faire remonter de ResourceNotFoundError
+    return container_client.get_blob_client(path).exists()
+
+def list_year_dirs(container_client, unzip_root: str) -> List[str]:
+    """Retourne les prefixes 'unzip/dis-YYYY-dept/' existants."""
+    prefixes = set()
+    # listing hiérarchique côté serveur : seuls les "dossiers" de 1er niveau sont renvoyés
+    for item in container_client.walk_blobs(name_starts_with=f"{unzip_root}/", delimiter="/"):
+        if not isinstance(item, BlobPrefix):
+            continue
+        dir_name = item.name[len(unzip_root) + 1:].rstrip("/")
+        if dir_name.startswith("dis-") and dir_name.endswith("-dept"):
+            prefixes.add(item.name)
+    return sorted(prefixes)
+
+def detect_sep(sample: str, force_sep: Optional[str] = None) -> str:
+    if force_sep:
+        return force_sep
+    candidates = [";", ",", "\t", "|"]
+    # histogramme des octets en une seule passe (candidats ASCII → 1 octet en UTF-8)
+    hist = np.bincount(np.frombuffer(sample.encode("utf-8"), dtype=np.uint8), minlength=256)
+    counts = {c: int(hist[ord(c)]) for c in candidates}
+    best = max(counts, key=counts.get)
+    return best if counts[best] > 0 else ";"
+
+def detect_encoding(sample, force_encoding: Optional[str] = None) -> str:
+    if force_encoding:
+        return force_encoding
+    for enc in ("utf-8", "utf-8-sig"):
+        try:
+            str(sample, enc)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    # dernier recours : latin-1 décode n'importe quel octet
+    return "latin-1"
+
+class ChunkStream(io.RawIOBase):
+    """Flux en lecture seule sur les chunks d'un download_blob() (pas de copie du fichier entier)."""
+
+    def __init__(self, first: bytes, chunks):
+        self._buf = memoryview(first)
+        self._chunks = chunks
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            nxt = next(self._chunks, None)
+            if nxt is None:
+                return 0
+            self._buf = memoryview(nxt)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def read_csv_stream(stream, enc: str, sep: str, names: List[str]) -> pa.Table:
+    # lecture pyarrow (C++ multithread) ; tout en string pour éviter les surprises de typage
+    return pacsv.read_csv(
+        stream,
+        read_options=pacsv.ReadOptions(encoding=enc, use_threads=True, column_names=names, skip_rows=1),
+        parse_options=pacsv.ParseOptions(delimiter=sep),
+        convert_options=pacsv.ConvertOptions(
+            column_types={n: pa.string() for n in names},
+            strings_can_be_null=True,
+        ),
+    )
+
+def head_end(data: bytes, n_lines: int) -> int:
+    """Position juste après la n-ième fin de ligne (ou fin des données) : pas de split du fichier."""
+    i = 0
+    for _ in range(n_lines):
+        j = data.find(b"\n", i)
+        if j < 0:
+            return len(data)
+        i = j + 1
+    return i
+
+def sniff_header(prefix: bytes, force_sep: Optional[str] = None,
+                 force_encoding: Optional[str] = None) -> Optional[Tuple[str, str, List[str]]]:
+    """Retourne (encodage, séparateur, noms de colonnes) détectés sur le début d'un fichier."""
+    # encodage validé sur les lignes complètes du préfixe (vue mémoire : pas de copie)
+    enc = detect_encoding(memoryview(prefix)[:prefix.rfind(b"\n") + 1 or len(prefix)], force_encoding)
+    # séparateur : SNIFF_LINES premières lignes seulement
+    head = prefix[:head_end(prefix, SNIFF_LINES)].decode(enc, errors="replace")
+    sep = detect_sep(head, force_sep)
+    if not head.strip():
+        return None
+    # en-tête lu à part : noms normalisés + toutes les colonnes en string
+    header = next(csv.reader([head.splitlines()[0]], delimiter=sep))
+    names = [c.lstrip("\ufeff").strip() for c in header]
+    return enc, sep, names
+
+def read_header(container_client, blob_path: str, force_sep: Optional[str] = None,
+                force_encoding: Optional[str] = None) -> Optional[Tuple[str, str, List[str]]]:
+    """(encodage, séparateur, noms de colonnes) d'un fichier, lus sur une petite lecture Range.
+
+    Seule source de vérité pour les noms : le schéma du parquet et la lecture complète
+    (read_txt_to_table) utilisent le même résultat, pas deux détections qui pourraient diverger.
+    """
+    data = container_client.get_blob_client(blob_path).download_blob(offset=0, length=HEADER_PROBE_BYTES).readall()
+    return sniff_header(data, force_sep, force_encoding)
+
+def read_txt_to_table(container_client, blob_path: str, enc: str, sep: str, names: List[str],
+                      force_encoding: Optional[str] = None) -> Optional[pa.Table]:
+    # enc / sep / names : ceux de read_header ; la ligne d'en-tête est sautée (skip_rows=1), les
+    # noms ne dépendent donc pas de l'encodage utilisé pour le corps du fichier
+    # max_concurrency=1 : le parallélisme se fait au niveau des fichiers (cf. build_year_parquet)
+    blob_client = container_client.get_blob_client(blob_path)
+    try:
+        try:
+            chunks = blob_client.download_blob(max_concurrency=1).chunks()
+            return read_csv_stream(ChunkStream(b"", chunks), enc, sep, names)
+        except pa.ArrowInvalid as e:
+            if force_encoding or enc == "latin-1" or "UTF8" not in str(e):
+                raise
+            # octets non UTF-8 après l'en-tête sondé : on relit le blob en Latin-1
+            print(f"   ⚠️ {blob_path} n'est pas en UTF-8, relecture en latin-1")
+            chunks = blob_client.download_blob(max_concurrency=1).chunks()
+            return read_csv_stream(ChunkStream(b"", chunks), "latin-1", sep, names)
+    except pa.ArrowInvalid as e:
+        # seul un fichier mal formé est sauté : une erreur réseau / Azure en cours de stream doit
+        # remonter et faire échouer l'année, sinon le parquet est uploadé sans ce fichier
+        # (et jamais réparé ensuite, cf. SKIP_IF_*EXISTS)
+        print(f"   ❌ lecture KO {blob_path}: {e}")
+        return None
+
+def align_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    # une colonne hors schéma serait perdue sans bruit : c'est un bug (noms d'en-tête divergents)
+    extra = set(table.column_names) - set(schema.names)
+    if extra:
+        raise ValueError(f"colonnes hors schéma : {sorted(extra)}")
+    # colonnes absentes de ce fichier → complétées par des nulls
+    cols = [
+        table.column(n) if n in table.column_names else pa.nulls(table.num_rows, pa.string())
+        for n in schema.names
+    ]
+    return pa.Table.from_arrays(cols, schema=schema)
+
+def constant_column(value: str, n: int) -> pa.DictionaryArray:
+    # colonne constante dictionary-encodée : la chaîne n'est stockée qu'une fois (dictionnaire
+    # de taille 1), seuls les indices int32 (tous à 0) dépendent du nombre de lignes
+    return pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), pa.array([value], pa.string()))
+
+class RowGroupCoalescer:
+    """Regroupe les tables successives en row groups pleins de `row_group_rows` lignes.
+
+    Un petit fichier département ne donne pas un petit row group à lui seul (cf.
+    min_rows_per_group du writer dataset Arrow) ; seul le dernier row group peut être incomplet.
+    """
+
+    def __init__(self, writer: pq.ParquetWriter, row_group_rows: int):
+        self._writer = writer
+        self._row_group_rows = row_group_rows
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+
+    def write(self, table: pa.Table):
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows < self._row_group_rows:
+            return
+        buffered = pa.concat_tables(self._pending)
+        n_full = buffered.num_rows // self._row_group_rows * self._row_group_rows
+        self._writer.write_table(buffered.slice(0, n_full), row_group_size=self._row_group_rows)
+        rest = buffered.slice(n_full)
+        self._pending, self._pending_rows = ([rest] if rest.num_rows else []), rest.num_rows
+
+    def flush(self):
+        # reliquat (< row_group_rows lignes) → dernier row group
+        if self._pending:
+            self._writer.write_table(pa.concat_tables(self._pending), row_group_size=self._row_group_rows)
+        self._pending, self._pending_rows = [], 0
+
+def build_year_parquet(container_client, txt_paths: List[str], year: str, download_workers: int,
+                       row_group_rows: Optional[int] = None, force_sep: Optional[str] = None,
+                       force_encoding: Optional[str] = None) -> Tuple[io.BytesIO, int]:
+    """Assemble les .txt d'une année en un seul parquet en mémoire ; retourne (buffer, nb de lignes).
+
+    row_group_rows=None : un row group par fichier ; sinon row groups pleins (RowGroupCoalescer).
+    """
+    with ThreadPoolExecutor(max_workers=download_workers) as ex:
+        # 1) schéma unifié (toutes colonnes en string) à partir des en-têtes : le ParquetWriter
+        #    doit le connaître avant la première écriture
+        headers = {}
+        names = []
+        sniffs = ex.map(lambda p: read_header(container_client, p, force_sep, force_encoding), txt_paths)
+        for p, sniffed in zip(txt_paths, sniffs):
+            if sniffed is None:
+                print(f"   ⚠️ en-tête vide, fichier ignoré : {p}")
+                continue
+            headers[p] = sniffed
+            names += [n for n in sniffed[2] if n not in names]
+        schema = pa.schema(
+            [(n, pa.string()) for n in names]
+            + [(n, TRACE_TYPE) for n in ("_source_blob", "_year")]
+        )
+
+        def submit(p: str):
+            return p, ex.submit(read_txt_to_table, container_client, p, *headers[p], force_encoding)
+
+        # 2) téléchargements en parallèle (les clients Azure sont thread-safe), chaque fichier
+        #    est écrit dès qu'il est lu, sans concaténer toute l'année en mémoire.
+        #    Fenêtre glissante : au plus download_workers fichiers lus d'avance, le suivant n'est
+        #    soumis qu'une fois la tête écrite (le writer borne la mémoire, pas les threads)
+        buf = io.BytesIO()
+        rows = 0
+        todo = iter(headers)
+        window = deque(submit(p) for p in islice(todo, download_workers))
+        with pq.ParquetWriter(buf, schema, compression="zstd") as writer:
+            row_groups = RowGroupCoalescer(writer, row_group_rows) if row_group_rows else None
+            while window:
+                p, future = window.popleft()
+                print(f"   • {p}")
+                table = future.result()
+                del future
+                if table is not None and table.num_rows > 0:
+                    # Ajoute colonnes de traçabilité
+                    table = table.append_column("_source_blob", constant_column(p, table.num_rows))
+                    table = table.append_column("_year", constant_column(year, table.num_rows))
+                    table = align_to_schema(table, schema)
+                    if row_groups:
+                        row_groups.write(table)
+                    else:
+                        writer.write_table(table)
+                    rows += table.num_rows
+                del table  # libère la table une fois écrite, avant de lire le fichier suivant
+                for nxt in islice(todo, 1):
+                    window.append(submit(nxt))
+
+            if row_groups:
+                row_groups.flush()
+
+    buf.seek(0)
+    return buf, rows
+
+# client mis en cache au niveau module, un par process : credentials parsés une fois, pipeline
+# HTTP et pool de connexions réutilisés par toutes les années traitées dans ce process
+_CONTAINERS = {}
+
+def get_container_client(conn_str: str, container: str):
+    # clé par PID : recréé dans un process fils, le pool de sockets hérité du parent (fork)
+    # n'est pas partageable
+    key = (os.getpid(), conn_str, container)
+    if key not in _CONTAINERS:
+        # chunks plus gros que le défaut : moins d'allers-retours sur les gros .txt
+        svc = BlobServiceClient.from_connection_string(
+            conn_str,
+            max_single_get_size=MAX_SINGLE_GET_SIZE,
+            max_chunk_get_size=MAX_CHUNK_GET_SIZE,
+        )
+        _CONTAINERS[key] = svc.get_container_client(container)
+    return _CONTAINERS[key]
@@ -0,0 +1,39 @@
+# tests/conftest.py
+import importlib
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+INGEST_DIR = Path(__file__).resolve().parents[1] / "notebooks" / "01_ingest_qualite_eau"
+# chaîne bien formée mais factice : les scripts la lisent à l'import, aucun appel réseau n'est fait
+FAKE_CONN_STR = (
+    "DefaultEndpointsProtocol=https;AccountName=test;"
+    "AccountKey=dGVzdA==;EndpointSuffix=core.windows.net"
+)
+
+
+@pytest.fixture
+def load_script(monkeypatch):
+    """Charge un script d'ingestion (nom commençant par un chiffre) comme module."""
+
+    def _load(filename: str):
+        monkeypatch.setenv("AZURE_STORAGE_CONNECTION_STRING", FAKE_CONN_STR)
+        # les scripts importent leurs modules voisins (ex. txt_parquet)
+        monkeypatch.syspath_prepend(str(INGEST_DIR))
+        spec = importlib.util.spec_from_file_location(
+            "ingest_" + Path(filename).stem.lstrip("0123456789_"), INGEST_DIR / filename
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return _load
+
+
+@pytest.fixture
+def txt_parquet(monkeypatch):
+    """Module commun de lecture .txt / écriture parquet (03 et 04)."""
+    pytest.importorskip("pyarrow")
+    monkeypatch.syspath_prepend(str(INGEST_DIR))
+    return importlib.import_module("txt_parquet")
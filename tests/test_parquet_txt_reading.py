@@ -0,0 +1,184 @@
+# tests/test_parquet_txt_reading.py
+import io
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+class FakeDownload:
+    def __init__(self, data: bytes, chunk_size: int):
+        self._data = data
+        self._chunk_size = chunk_size
+
+    def readall(self) -> bytes:
+        return self._data
+
+    def chunks(self):
+        for i in range(0, len(self._data), self._chunk_size):
+            yield self._data[i : i + self._chunk_size]
+
+
+class FakeBlob:
+    def __init__(self, data: bytes, chunk_size: int):
+        self._data = data
+        self._chunk_size = chunk_size
+        self.downloads = 0  # téléchargements complets (hors sonde Range de l'en-tête)
+
+    def _download(self, data: bytes) -> FakeDownload:
+        return FakeDownload(data, self._chunk_size)
+
+    def download_blob(self, offset=None, length=None, max_concurrency=1):
+        if offset is not None:
+            return FakeDownload(self._data[offset : offset + length], self._chunk_size)
+        self.downloads += 1
+        return self._download(self._data)
+
+
+class FakeContainer:
+    def __init__(self, blobs: dict):
+        self.blobs = blobs
+
+    def get_blob_client(self, name: str) -> FakeBlob:
+        return self.blobs[name]
+
+
+def _read_txt(txt_parquet, container, path):
+    # comme build_year_parquet : en-tête sondé une fois, réutilisé pour la lecture complète
+    sniffed = txt_parquet.read_header(container, path)
+    return txt_parquet.read_txt_to_table(container, path, *sniffed)
+
+
+def test_head_end(txt_parquet):
+    assert txt_parquet.head_end(b"a\nb\nc\n", 2) == 4
+    assert txt_parquet.head_end(b"a\nb", 5) == 3
+    assert txt_parquet.head_end(b"", 3) == 0
+
+
+def test_chunk_stream_concatenates_chunks(txt_parquet):
+    stream = txt_parquet.ChunkStream(b"ab", iter([b"", b"cde", b"", b"f"]))
+    parts = []
+    while True:
+        part = stream.read(2)
+        if not part:
+            break
+        parts.append(part)
+    assert b"".join(parts) == b"abcdef"
+    assert all(len(p) <= 2 for p in parts)
+
+    assert txt_parquet.ChunkStream(b"", iter([])).read(10) == b""
+    assert (
+        io.BufferedReader(txt_parquet.ChunkStream(b"x", iter([b"yz"]))).read() == b"xyz"
+    )
+
+
+def test_sniff_header_prefix_cut_mid_line(txt_parquet):
+    # préfixe coupé en pleine ligne, au milieu d'un caractère UTF-8 multi-octets
+    prefix = "cdreseau;nom;ville\n001;Élan;Orléans\n002;B;Lyo".encode() + b"\xc3"
+    enc, sep, names = txt_parquet.sniff_header(prefix)
+    assert enc == "utf-8"
+    assert sep == ";"
+    assert names == ["cdreseau", "nom", "ville"]
+
+
+def test_sniff_header_without_newline(txt_parquet):
+    assert txt_parquet.sniff_header(b"a|b |c") == ("utf-8", "|", ["a", "b", "c"])
+    assert txt_parquet.sniff_header(b"") is None
+
+
+def test_sniff_header_latin1(txt_parquet):
+    enc, sep, names = txt_parquet.sniff_header(
+        "réseau,libellé\nx,é\n".encode("latin-1")
+    )
+    assert (enc, sep, names) == ("latin-1", ",", ["réseau", "libellé"])
+
+
+def test_read_txt_with_bom_header(txt_parquet):
+    data = "\ufeffcdreseau;nom\n001;Élan\n002;\n".encode("utf-8")
+    container = FakeContainer({"p.txt": FakeBlob(data, chunk_size=1024)})
+
+    table = _read_txt(txt_parquet, container, "p.txt")
+
+    assert table.column_names == ["cdreseau", "nom"]
+    assert table.to_pylist() == [
+        {"cdreseau": "001", "nom": "Élan"},
+        {"cdreseau": "002", "nom": None},
+    ]
+
+
+def test_read_txt_invalid_utf8_after_probe_rereads_as_latin1(txt_parquet, monkeypatch):
+    # sonde d'en-tête en pur ASCII (→ détectée UTF-8), octets Latin-1 seulement plus loin
+    monkeypatch.setattr(txt_parquet, "HEADER_PROBE_BYTES", 64)
+    lines = ["cdreseau;nom"] + [f"{i:03d};abc" for i in range(50)] + ["999;Orléans"]
+    data = ("\n".join(lines) + "\n").encode("latin-1")
+    blob = FakeBlob(data, chunk_size=64)
+    container = FakeContainer({"p.txt": blob})
+
+    table = _read_txt(txt_parquet, container, "p.txt")
+
+    assert blob.downloads == 2
+    assert table.num_rows == 51
+    assert table.column("nom").to_pylist()[-1] == "Orléans"
+    assert table.column("cdreseau").to_pylist()[:2] == ["000", "001"]
+
+
+class BrokenDownload(FakeDownload):
+    def chunks(self):
+        yield self._data[: self._chunk_size]
+        raise ConnectionError("connexion coupée")
+
+
+class BrokenBlob(FakeBlob):
+    def _download(self, data: bytes) -> FakeDownload:
+        return BrokenDownload(data, self._chunk_size)
+
+
+def test_read_txt_network_error_mid_stream_propagates(txt_parquet):
+    data = ("cdreseau;nom\n" + "001;abc\n" * 100).encode()
+    container = FakeContainer({"p.txt": BrokenBlob(data, chunk_size=64)})
+
+    with pytest.raises(ConnectionError):
+        _read_txt(txt_parquet, container, "p.txt")
+
+
+def test_read_txt_malformed_csv_is_skipped(txt_parquet):
+    data = b"a;b\n1;2\n3;4;5;6\n"
+    container = FakeContainer({"p.txt": FakeBlob(data, chunk_size=1024)})
+
+    assert _read_txt(txt_parquet, container, "p.txt") is None
+
+
+def test_build_year_parquet_keeps_probe_header_names(txt_parquet, monkeypatch):
+    # en-tête UTF-8, octet Latin-1 après la sonde mais dans le 1er chunk : les noms de colonnes
+    # du schéma et ceux de la lecture doivent rester identiques ('libellé', pas 'libellÃ©')
+    monkeypatch.setattr(txt_parquet, "HEADER_PROBE_BYTES", 64)
+    body = "".join(f"{i:03d};abc\n" for i in range(50)).encode()
+    p1 = "cdreseau;libellé\n".encode() + body + "999;Orléans\n".encode("latin-1")
+    p2 = b"cdreseau\n777\n"
+    container = FakeContainer(
+        {
+            "unzip/dis-2021-dept/DIS_PLV_1.txt": FakeBlob(p1, chunk_size=1 << 20),
+            "unzip/dis-2021-dept/DIS_PLV_2.txt": FakeBlob(p2, chunk_size=1 << 20),
+        }
+    )
+
+    buf, rows = txt_parquet.build_year_parquet(
+        container, sorted(container.blobs), "2021", download_workers=2
+    )
+
+    table = pq.read_table(buf)
+    assert rows == table.num_rows == 52
+    assert table.column_names == ["cdreseau", "libellé", "_source_blob", "_year"]
+    libelle = table.column("libellé").to_pylist()
+    assert libelle[:51] == ["abc"] * 50 + ["Orléans"]
+    assert libelle[51] is None  # 2e fichier sans cette colonne
+    assert table.column("_source_blob").to_pylist()[-1].endswith("DIS_PLV_2.txt")
+
+
+def test_align_to_schema_rejects_unknown_columns(txt_parquet):
+    schema = pa.schema([("a", pa.string())])
+    table = pa.table({"a": ["1"], "b": ["2"]})
+
+    with pytest.raises(ValueError, match="hors schéma"):
+        txt_parquet.align_to_schema(table, schema)
@@ -0,0 +1,57 @@
+# tests/test_row_group_coalescing.py
+import io
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _file_table(txt_parquet, source: str, start: int, n: int, schema) -> pa.Table:
+    table = pa.table(
+        {"val": pa.array([str(i) for i in range(start, start + n)], pa.string())}
+    )
+    table = table.append_column("_source_blob", txt_parquet.constant_column(source, n))
+    table = table.append_column("_year", txt_parquet.constant_column("2021", n))
+    return txt_parquet.align_to_schema(table, schema)
+
+
+@pytest.mark.parametrize(
+    "sizes",
+    [
+        # petits fichiers qui chevauchent les frontières de row group
+        [3, 5, 1, 7, 2, 4],
+        [12],  # un seul fichier plus gros que plusieurs row groups
+        [4, 4],  # frontières exactes, pas de reliquat
+        [1, 2],  # moins d'un row group au total
+    ],
+)
+def test_coalescer_writes_full_row_groups_in_order(txt_parquet, sizes):
+    row_group_rows = 4
+    schema = pa.schema(
+        [("val", pa.string())]
+        + [(n, txt_parquet.TRACE_TYPE) for n in ("_source_blob", "_year")]
+    )
+
+    buf = io.BytesIO()
+    expected, start = [], 0
+    with pq.ParquetWriter(buf, schema) as writer:
+        row_groups = txt_parquet.RowGroupCoalescer(writer, row_group_rows)
+        for i, n in enumerate(sizes):
+            table = _file_table(txt_parquet, f"f{i}.txt", start, n, schema)
+            row_groups.write(table)
+            expected += table.to_pylist()
+            start += n
+        row_groups.flush()
+
+    buf.seek(0)
+    parquet = pq.ParquetFile(buf)
+    rg_rows = [
+        parquet.metadata.row_group(i).num_rows
+        for i in range(parquet.metadata.num_row_groups)
+    ]
+    assert all(n == row_group_rows for n in rg_rows[:-1])
+    assert 0 < rg_rows[-1] <= row_group_rows
+    assert sum(rg_rows) == sum(sizes)
+    # ni perte ni réordonnancement (valeurs + colonnes de traçabilité)
+    assert parquet.read().to_pylist() == expected
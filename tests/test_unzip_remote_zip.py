@@ -0,0 +1,183 @@
+# tests/test_unzip_remote_zip.py
+import io
+import os
+import threading
+import zipfile
+
+import pytest
+
+
+class FakeDownload:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def readall(self) -> bytes:
+        return self._data
+
+
+class FakeBlob:
+    """Blob en mémoire : sert des plages d'octets comme download_blob(offset, length)."""
+
+    def __init__(self, store: dict, name: str, stats=None):
+        self._store = store
+        self.name = name
+        self.range_calls = 0
+        self._stats = stats if stats is not None else {}
+
+    @property
+    def size(self) -> int:
+        return len(self._store[self.name])
+
+    def exists(self) -> bool:
+        return self.name in self._store
+
+    def download_blob(self, offset=None, length=None):
+        self.range_calls += 1
+        data = self._store[self.name]
+        start = offset or 0
+        end = len(data) if length is None else start + length
+        chunk = data[start:end]
+        self._stats["fetched"] = self._stats.get("fetched", 0) + len(chunk)
+        return FakeDownload(chunk)
+
+    def upload_blob(self, data, length=None, overwrite=False, **kwargs):
+        if not overwrite and self.name in self._store:
+            raise RuntimeError(f"blob déjà présent : {self.name}")
+        if not hasattr(data, "read"):
+            self._store[self.name] = bytes(data)
+            return
+        if length is None:
+            # comme get_length du SDK : mesure du flux par seek(0, END) puis retour
+            pos = data.tell()
+            data.seek(0, io.SEEK_END)
+            length = data.tell() - pos
+            data.seek(pos)
+        self._store[self.name] = data.read(length)
+
+
+class FakeContainer:
+    def __init__(self, store: dict):
+        self.store = store
+        self.stats = {
+            "fetched": 0
+        }  # octets lus via download_blob, tous blobs confondus
+        self._lock = threading.Lock()
+
+    def list_blobs(self, name_starts_with=""):
+        with self._lock:
+            names = sorted(n for n in self.store if n.startswith(name_starts_with))
+        return [FakeBlob(self.store, n, self.stats) for n in names]
+
+    def get_blob_client(self, name: str) -> FakeBlob:
+        return FakeBlob(self.store, name, self.stats)
+
+
+def _make_zip() -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(
+            "DIS_PLV_2021.txt",
+            b"cdreseau;nom\n" + b"001;A\n" * 20000,
+            zipfile.ZIP_DEFLATED,
+        )
+        zf.writestr("DIS_RESULT_2021.txt", os.urandom(50000), zipfile.ZIP_STORED)
+        zf.writestr("sub/", b"")
+        zf.writestr(
+            "sub/DIS_COM_UDI_2021.txt",
+            "é;à\n".encode("latin-1") * 500,
+            zipfile.ZIP_DEFLATED,
+        )
+        for i in range(10):
+            zf.writestr(
+                f"small/{i}.txt", f"{i}\n".encode() * (i + 1), zipfile.ZIP_DEFLATED
+            )
+    return buf.getvalue()
+
+
+@pytest.fixture
+def unzip(load_script):
+    return load_script("02_unzip.py")
+
+
+def test_range_reader_seek_and_read(unzip):
+    data = bytes(range(256)) * 4
+    reader = unzip.BlobRangeReader(FakeBlob({"b": data}, "b"), len(data))
+
+    assert reader.seek(-10, io.SEEK_END) == len(data) - 10
+    assert reader.read(100) == data[-10:]
+    assert reader.read(1) == b""
+
+    reader.seek(5)
+    assert reader.seek(3, io.SEEK_CUR) == 8
+    assert reader.tell() == 8
+    assert reader.read(4) == data[8:12]
+
+    # position négative ramenée à 0
+    assert reader.seek(-5, io.SEEK_CUR) == 7
+    assert reader.seek(-100, io.SEEK_CUR) == 0
+
+    with pytest.raises(ValueError):
+        reader.seek(0, 3)
+
+
+def test_range_reader_past_end_reads_nothing(unzip):
+    data = b"abcdef"
+    blob = FakeBlob({"b": data}, "b")
+    reader = unzip.BlobRangeReader(blob, len(data))
+    reader.seek(100)
+    assert reader.read(10) == b""
+    assert blob.range_calls == 0
+
+
+def test_open_remote_zip_matches_zipfile(unzip, monkeypatch):
+    payload = _make_zip()
+    # petites lectures Range pour exercer les frontières de buffer
+    monkeypatch.setattr(unzip, "RANGE_READ_SIZE", 1024)
+    blob = FakeBlob({"zip/dis-2021-dept.zip": payload}, "zip/dis-2021-dept.zip")
+
+    with zipfile.ZipFile(io.BytesIO(payload)) as expected, unzip._open_remote_zip(
+        unzip.BlobRangeReader(blob, len(payload))
+    ) as remote:
+        assert remote.namelist() == expected.namelist()
+        for info in expected.infolist():
+            if not info.is_dir():
+                assert remote.read(info.filename) == expected.read(info.filename)
+
+
+def test_main_extracts_all_members_in_parallel(unzip, monkeypatch):
+    payload = _make_zip()
+    container = FakeContainer({"zip/dis-2021-dept.zip": payload})
+    monkeypatch.setattr(unzip, "_CONTAINER", container)
+    monkeypatch.setattr(unzip, "RANGE_READ_SIZE", 4096)
+    monkeypatch.setattr(unzip, "EXTRACT_WORKERS", 4)
+
+    unzip.main()
+
+    with zipfile.ZipFile(io.BytesIO(payload)) as expected:
+        files = [i.filename for i in expected.infolist() if not i.is_dir()]
+        for name in files:
+            assert container.store[f"unzip/dis-2021-dept/{name}"] == expected.read(name)
+    marker = container.store["unzip/dis-2021-dept/_SUCCESS"].decode()
+    assert f"files_extracted={len(files)}" in marker
+
+    # 2e passage : marker présent → rien n'est ré-extrait
+    before = dict(container.store)
+    unzip.main()
+    assert container.store == before
+
+
+def test_main_fetches_each_member_once(unzip, monkeypatch):
+    payload = _make_zip()
+    container = FakeContainer({"zip/dis-2021-dept.zip": payload})
+    monkeypatch.setattr(unzip, "_CONTAINER", container)
+    # buffer plus grand que l'archive : sans borne par entrée, chaque GET lirait tout le zip
+    monkeypatch.setattr(unzip, "RANGE_READ_SIZE", 1 << 20)
+    monkeypatch.setattr(unzip, "EXTRACT_WORKERS", 4)
+
+    unzip.main()
+
+    with zipfile.ZipFile(io.BytesIO(payload)) as expected:
+        central_dir = len(payload) - expected.start_dir
+    # données des entrées lues une fois ; répertoire central relu à chaque ouverture de
+    # ZipFile (1 pour la liste des entrées + 1 par worker) et en fin de dernière entrée
+    assert container.stats["fetched"] <= len(payload) + (4 + 2) * central_dir